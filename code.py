@@ -1,18 +1,37 @@
-import random
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import itertools
+from numba import get_num_threads, njit, prange
 from pulp import LpMaximize, LpProblem, LpVariable, lpSum, LpBinary, LpStatus
 
 num_seats = 100 # Initialize the total number of seats available (Can change if want)
+SEAT_BIN = 5 # Number of consecutive seats_left values sharing one row of the Q-table
 time_horizon = 12 # Time horizon (represents a single day of ticket sales) (Big assumption)
 price_levels = list(range(100, 650+1, 20)) # Available price levels for tickets (ceiling levels by $20) (arbitrary choice)
 customer_segments = ['Economy', 'Business'] # Should we add first-class?
 booking_rates = ['Low', 'Medium', 'High'] # Dependent on # seats_sold and time elasped in the horizon
 competitor_prices = ['Low', 'Medium', 'High'] # Dependent on time 
 
+# Integer encodings of the categorical state components (used by the compiled helpers and the Q-table)
+BR = {name: i for i, name in enumerate(booking_rates)}
+CP = {name: i for i, name in enumerate(competitor_prices)}
+SEG = {name: i for i, name in enumerate(customer_segments)}
+
+actions = price_levels
+n_actions = len(actions)
+n_booking_rates = len(booking_rates)
+n_competitor_prices = len(competitor_prices)
+n_segments = len(customer_segments)
+price_levels_arr = np.array(price_levels)
+price_levels_f32 = price_levels_arr.astype(np.float32) # Rewards, kept in the Q-table's dtype
+
+PRICE_SENS = np.array([0.002, 0.001]) # Price sensitivity per customer segment (Economy, Business)
+ELASTICITY = np.array([1.2, 0.8]) # Customer elasticity per customer segment (Economy, Business)
+COMPETITOR_INFLUENCE = np.array([0.75, 1.05, 1.3]) # Demand multiplier per competitor price level (Low, Medium, High)
+
+@njit(cache=True)
 def get_demand_probability(price, customer_segment, competitor_price_level):
     """
     Calculates demand probability incorporating nonlinear price sensitivity and competitor dynamics.
@@ -24,119 +43,148 @@ def get_demand_probability(price, customer_segment, competitor_price_level):
       - Higher prices (e.g., 'High') increase demand by 30% (multiplier of 1.3).
     - `customer_elasticity`: Applies nonlinear scaling of price sensitivity:
       - Greater elasticity for 'Economy' (1.2) than 'Business' (0.8).
+    - `customer_segment` and `competitor_price_level` are the integer encodings from `SEG` and `CP`.
     - Returns a probability between 0.1 and 1.0 after applying all factors.
     """
     base_prob = 0.5
-    price_sensitivity = {'Economy': 0.002, 'Business': 0.001}[customer_segment]
-    competitor_influence = {'Low': 0.75, 'Medium': 1.05, 'High': 1.3}[competitor_price_level]
-    customer_elasticity = 1.2 if customer_segment == 'Economy' else 0.8
+    price_sensitivity = PRICE_SENS[customer_segment]
+    competitor_influence = COMPETITOR_INFLUENCE[competitor_price_level]
+    customer_elasticity = ELASTICITY[customer_segment]
     demand_prob = base_prob * (np.exp(-price_sensitivity * price ** customer_elasticity) + 0.1) * competitor_influence
     return min(max(demand_prob, 0.1), 1.0)
 
+# Booking-rate time adjustment 1 / (1 + log(1 + time_elapsed)) for every elapsed time step
+LOG_FACTOR = np.array([1.0 / (1.0 + np.log1p(t)) for t in range(time_horizon + 1)], dtype=np.float32)
+LOW_THR = num_seats / (4 * time_horizon) # 25% of expected average sales
+MED_THR = (3 * num_seats) / (5 * time_horizon) # 60% of expected average sales
+
+@njit(cache=True)
 def get_booking_rate(seats_sold, time_elapsed):
     """
     Categorizes booking rates using non-linear thresholds based on time elapsed and dynamic seat adjustment.
-    - `time_factor`: Calculates the logarithmic effect of elapsed time on the booking rate.
+    - `LOG_FACTOR`: Precomputed logarithmic effect of elapsed time on the booking rate.
       - Prevents extremely high rates at low time intervals.
-    - `rate`: The booking rate, derived from the number of seats sold divided by time adjusted by `time_factor`.
-    - Thresholds:
-      - 'Low' if the rate is below 25% of expected average sales (num_seats / (4 * time_horizon)).
-      - 'Medium' for rates below 60% of expected average sales ((3 * num_seats) / (5 * time_horizon)).
-      - 'High' otherwise, signifying peak booking speed.
-    """
-    time_factor = np.log(1 + time_elapsed) if time_elapsed > 0 else 0
-    rate = seats_sold / (1 + time_factor)
-    low_threshold = num_seats / (4 * time_horizon)
-    medium_threshold = (3 * num_seats) / (5 * time_horizon)
-    high_threshold = num_seats / time_horizon
-
-    if rate < low_threshold:
-        return 'Low'
-    elif rate < medium_threshold:
-        return 'Medium'
-    elif rate < high_threshold:
-        return 'High'
-    else:
-        return 'High'
-
-def get_competitor_price_level(time):
+    - `rate`: The booking rate, derived from the number of seats sold divided by time adjusted by the log factor.
+    - Thresholds (returned as the `BR` encoding):
+      - 'Low' (0) if the rate is below 25% of expected average sales (`LOW_THR`).
+      - 'Medium' (1) for rates below 60% of expected average sales (`MED_THR`).
+      - 'High' (2) otherwise, signifying peak booking speed.
+    """
+    rate = seats_sold * LOG_FACTOR[time_elapsed]
+    return 0 if rate < LOW_THR else 1 if rate < MED_THR else 2
+
+@njit(cache=True)
+def get_competitor_price_level(time, fluctuation):
     """
     Assigns competitor pricing dynamically based on time progression and stochastic fluctuations.
-    - `baseline_level`: A fixed sequence of competitor price levels ['Low', 'Medium', 'High'].
+    - `baseline_level`: The number of competitor price levels ['Low', 'Medium', 'High'].
     - `shift_factor`: Adjusts the baseline index proportionally to the elapsed time.
-    - `fluctuation`: Introduces random variation to the index, sampled from a normal distribution.
-    - Ensures dynamic pricing with probabilistic variations, returning one of the baseline levels.
+    - `fluctuation`: Introduces random variation to the index, pre-sampled by the caller from a normal
+      distribution (mean 0, standard deviation 0.5).
+    - Ensures dynamic pricing with probabilistic variations, returning the `CP` encoding of one of the baseline levels.
     """
-    baseline_level = ['Low', 'Medium', 'High']
-    shift_factor = (time / time_horizon) * len(baseline_level)
-    fluctuation = np.random.normal(loc=0, scale=0.5)
-    adjusted_level = int((shift_factor + fluctuation) % len(baseline_level))
-    return baseline_level[adjusted_level]
+    baseline_level = n_competitor_prices
+    shift_factor = (time / time_horizon) * baseline_level
+    return int((shift_factor + fluctuation) % baseline_level)
 
-def get_customer_segment(time, seats_left):
+@njit(cache=True)
+def get_customer_segment(time, seats_left, draw):
     """
     Randomly assigns customer segment, favoring business travelers as time approaches zero.
+    - `draw`: A uniform random number in [0, 1), pre-sampled by the caller.
     - `economy_bias`: Represents the likelihood of an 'Economy' customer:
       - Decreases as time decreases (more last-minute bookings by business travelers).
     - Ensures higher probability of 'Business' customers when seats left are critically low (< num_seats / 3).
     - Randomly chooses between 'Economy' and 'Business' when conditions are neutral.
+    - Returns the `SEG` encoding (0 for 'Economy', 1 for 'Business').
     """
     economy_bias = max(0.2, 1 - time / time_horizon)
     if seats_left < num_seats / 3:
-        return 'Business' if np.random.rand() < (1 - economy_bias) else 'Economy'
-    return random.choice(customer_segments)
+        return 1 if draw < (1 - economy_bias) else 0
+    return int(draw * n_segments)
+
+# Demand probability for every (price level, customer segment, competitor price level) combination
+DEMAND = np.empty((n_actions, n_segments, n_competitor_prices), dtype=np.float32)
+for a_idx, seg, cp in itertools.product(range(n_actions), range(n_segments), range(n_competitor_prices)):
+    DEMAND[a_idx, seg, cp] = get_demand_probability(price_levels_arr[a_idx], seg, cp)
 
 # Q-learning parameters
-alpha = 0.15  # Learning rate
+alpha = 0.15  # Initial learning rate
+alpha_min = 0.01  # Learning rate reached in the final episode (decays linearly)
 gamma = 0.85  # Discount factor
-epsilon = 0.2  # Exploration rate
+epsilon = 0.5  # Initial exploration rate
+epsilon_min = 0.01  # Lower threshold for the exploration rate
+epsilon_decay = 0.999  # Per-episode multiplicative decay of the exploration rate
 episodes = 5000  # Number of training episodes, Change to number that can run it
+batch_size = 0  # Episodes simulated side by side by the vectorized NumPy trainer (0 uses the compiled per-episode loop)
 
-states = []
-for seats_left in range(num_seats + 1):
-    for time in range(time_horizon + 1):
-        for booking_rate in booking_rates:
-            for competitor_price in competitor_prices:
-                for customer_segment in customer_segments:
-                    states.append((seats_left, time, booking_rate, competitor_price, customer_segment))
+# Q-table indexed as Q[seats_left // SEAT_BIN, time, booking_rate, competitor_price, customer_segment, action]
+Q = np.zeros((num_seats // SEAT_BIN + 1, time_horizon + 1, n_booking_rates, n_competitor_prices,
+              n_segments, n_actions), dtype=np.float32)
+Q2 = Q.reshape(-1, n_actions) # Flat view of Q with one row per state id (shares memory with Q)
 
-actions = price_levels
-Q = {}
-for state in states:
-    for action in actions:
-        Q[(state, action)] = 0.0
+@njit(cache=True)
+def get_state_id(seats_left, time, booking_rate, competitor_price_level, customer_segment):
+    """
+    Flattens a state into its row index in `Q2`.
+    - Horner form of the row-major index of (seats_left // SEAT_BIN, time, booking_rate, competitor_price,
+      customer_segment) in `Q`.
+    - Works on scalars as well as on arrays of states.
+    """
+    seat_bin = seats_left // SEAT_BIN
+    return ((((seat_bin * (time_horizon + 1) + time) * n_booking_rates + booking_rate) * n_competitor_prices
+             + competitor_price_level) * n_segments + customer_segment)
 
-# Training the Q-learning model
-for episode in range(episodes):
+@njit(cache=True)
+def get_greedy_action(q_values):
+    """
+    Returns the index of the highest Q-value, breaking ties uniformly at random.
+    - Untrained states have all-zero rows, so without random tie-breaking they would always pick the lowest price.
+    """
+    ties = np.flatnonzero(q_values == q_values.max())
+    return ties[np.random.randint(ties.size)]
+
+@njit(cache=True)
+def run_episode(Q2, alpha, gamma, epsilon, fluctuations):
+    """
+    Simulates one selling horizon and updates the flattened Q-table `Q2` in place.
+    - The episode starts with all seats available and steps backwards through the time horizon
+      until time runs out or the flight is sold out.
+    - `fluctuations[time]` is the pre-sampled competitor price fluctuation used at each time step.
+    - The uniform rolls for exploration, random actions, customer segments and sales are drawn for the
+      whole episode up front and indexed by elapsed time.
+    - Actions are chosen epsilon-greedily over the price levels, and a sale earns the chosen price as reward.
+    - Returns the total reward collected in the episode.
+    """
+    alpha = np.float32(alpha)
+    gamma = np.float32(gamma)
     seats_left = num_seats
     seats_sold = 0
     time = time_horizon - 1
-    total_reward = 0
+    total_reward = 0.0
     time_elapsed = 0
+    booking_rate = get_booking_rate(seats_sold, time_elapsed)
+    competitor_price_level = get_competitor_price_level(time, fluctuations[time])
+    eps_rolls = np.random.random(time_horizon)
+    rand_actions = np.random.randint(0, n_actions, time_horizon)
+    segment_draws = np.random.randint(0, n_segments, time_horizon)
+    sale_rolls = np.random.random(time_horizon)
 
     while time > 0 and seats_left > 0:
-        booking_rate = get_booking_rate(seats_sold, time_elapsed)
-        competitor_price_level = get_competitor_price_level(time)
-        customer_segment = random.choice(customer_segments)
-        state = (seats_left, time, booking_rate, competitor_price_level, customer_segment)
+        customer_segment = segment_draws[time_elapsed]
+        state_id = get_state_id(seats_left, time, booking_rate, competitor_price_level, customer_segment)
 
-        if random.uniform(0, 1) < epsilon:
-            action = random.choice(actions)
+        if eps_rolls[time_elapsed] < epsilon:
+            a_idx = rand_actions[time_elapsed]
         else:
-            q_values = [Q[(state, a)] for a in actions]
-            max_q = max(q_values)
-            best_actions = [a for a in actions if Q[(state, a)] == max_q]
-            action = random.choice(best_actions)
-
-        demand_probability = get_demand_probability(action, customer_segment, competitor_price_level)
-        sale_occurred = np.random.binomial(1, demand_probability)
+            a_idx = get_greedy_action(Q2[state_id])
 
-        if sale_occurred:
+        if sale_rolls[time_elapsed] < DEMAND[a_idx, customer_segment, competitor_price_level]:
             seats_left -= 1
             seats_sold += 1
-            reward = action
+            reward = price_levels_f32[a_idx]
         else:
-            reward = 0
+            reward = np.float32(0.0)
 
         total_reward += reward
 
@@ -144,34 +192,155 @@ for episode in range(episodes):
         time_elapsed += 1
 
         next_booking_rate = get_booking_rate(seats_sold, time_elapsed)
-        next_competitor_price_level = get_competitor_price_level(time)
-        next_state = (seats_left, time, next_booking_rate, next_competitor_price_level, customer_segment)
-
-        if next_state in states:
-            future_q_values = [Q[(next_state, a)] for a in actions]
-            max_future_q = max(future_q_values)
+        next_competitor_price_level = get_competitor_price_level(time, fluctuations[time])
+        if time == 0 or seats_left == 0:
+            max_future_q = np.float32(0.0)
         else:
-            max_future_q = 0
+            next_state_id = get_state_id(seats_left, time, next_booking_rate, next_competitor_price_level,
+                                         customer_segment)
+            max_future_q = Q2[next_state_id].max()
+
+        # Skip writes that would not change the entry (e.g. no sale into a terminal or untrained state)
+        td = reward + gamma * max_future_q - Q2[state_id, a_idx]
+        if td != 0:
+            Q2[state_id, a_idx] += alpha * td
+
+        booking_rate, competitor_price_level = next_booking_rate, next_competitor_price_level
+
+    return total_reward
+
+@njit(parallel=True, cache=True)
+def train(Q2, alphas, gamma, epsilons, n_threads):
+    """
+    Trains the Q-table in place over `len(alphas)` simulated selling horizons, spread across CPU threads.
+    - `alphas` and `epsilons` hold the learning and exploration rate of each episode.
+    - Episodes are interleaved across `n_threads` workers (worker `tid` runs episodes tid, tid + n_threads, ...)
+      in a single parallel region, so every worker moves along the learning and exploration schedules together
+      and `rewards_log` stays in training order.
+    - All threads share `Q2` without locking (Hogwild!-style); Q-learning tolerates the occasional
+      lost or stale update this causes.
+    - Returns `rewards_log`, the total reward collected in each episode.
+    """
+    episodes = len(alphas)
+    rewards_log = np.empty(episodes)
+    fluctuations = np.random.normal(0.0, 0.5, (episodes, time_horizon)).astype(np.float32)
+    for tid in prange(n_threads):
+        for episode in range(tid, episodes, n_threads):
+            rewards_log[episode] = run_episode(Q2, alphas[episode], gamma, epsilons[episode], fluctuations[episode])
+    return rewards_log
+
+def get_booking_rates(seats_sold, time_elapsed):
+    """
+    Vectorized counterpart of `get_booking_rate` for an array of `seats_sold` at a shared `time_elapsed`.
+    - Returns an integer array of `BR` encodings.
+    """
+    rate = seats_sold * LOG_FACTOR[time_elapsed]
+    return (rate >= LOW_THR).astype(np.int64) + (rate >= MED_THR)
+
+def get_competitor_price_levels(time, fluctuation):
+    """
+    Vectorized counterpart of `get_competitor_price_level` for an array of pre-sampled fluctuations at a shared `time`.
+    - Returns an integer array of `CP` encodings.
+    """
+    shift_factor = (time / time_horizon) * n_competitor_prices
+    return ((shift_factor + fluctuation) % n_competitor_prices).astype(np.int64)
+
+def train_batched(Q2, batch_size, alphas, gamma, epsilons):
+    """
+    Trains the flattened Q-table `Q2` in place, simulating `batch_size` episodes side by side with vectorized NumPy operations.
+    - `alphas` and `epsilons` hold the learning and exploration rate of each episode.
+    - All episodes of a batch step through the time horizon together; episodes that have sold out stop
+      selling and updating.
+    - Q-values are updated for the whole batch at the end of each time step. Episodes that visited the same
+      state-action pair are averaged into a single update, so the entry moves by alpha times their mean
+      TD error rather than once per episode.
+    - Returns `rewards_log`, the total reward collected in each episode.
+    """
+    episodes = len(alphas)
+    gamma = np.float32(gamma)
+    zero_reward = np.float32(0.0)
+    rewards_log = np.empty(episodes)
+    for start in range(0, episodes, batch_size):
+        size = min(batch_size, episodes - start)
+        alpha = alphas[start:start + size]
+        epsilon = epsilons[start:start + size]
+        seats_left = np.full(size, num_seats)
+        seats_sold = np.zeros(size, dtype=np.int64)
+        total_reward = np.zeros(size)
+        booking_rate = get_booking_rates(seats_sold, 0)
+        fluctuations = np.random.normal(0.0, 0.5, (time_horizon, size)).astype(np.float32)
+        competitor_price_level = get_competitor_price_levels(time_horizon - 1, fluctuations[time_horizon - 1])
+
+        for time in range(time_horizon - 1, 0, -1):
+            time_elapsed = time_horizon - 1 - time
+            active = seats_left > 0
+            customer_segment = np.random.randint(n_segments, size=size)
+            state_id = get_state_id(seats_left, time, booking_rate, competitor_price_level, customer_segment)
 
-        Q[(state, action)] += alpha * (reward + gamma * max_future_q - Q[(state, action)])
+            q_values = Q2[state_id]
+            ties = q_values == q_values.max(axis=1, keepdims=True)
+            greedy_actions = (ties * np.random.random(q_values.shape)).argmax(axis=1)
+            random_actions = np.random.randint(n_actions, size=size)
+            a_idx = np.where(np.random.random(size) < epsilon, random_actions, greedy_actions)
 
-    if (episode + 1) % 100 == 0:
-        print(f"Episode {episode + 1}/{episodes}, Total Reward: {total_reward}")
+            sale_occurred = active & (np.random.random(size) < DEMAND[a_idx, customer_segment, competitor_price_level])
+            reward = np.where(sale_occurred, price_levels_f32[a_idx], zero_reward)
+            total_reward += reward
 
-optimal_policy = {} # Extract the optimal pricing policy based on trained Q-values
-for state in states:
-    q_values = [Q[(state, a)] for a in actions]
-    max_q = max(q_values)
-    best_actions = [a for a in actions if Q[(state, a)] == max_q]
-    optimal_action = random.choice(best_actions)
-    optimal_policy[state] = optimal_action
+            next_seats_left = seats_left - sale_occurred
+            seats_sold += sale_occurred
+
+            next_booking_rate = get_booking_rates(seats_sold, time_elapsed + 1)
+            next_competitor_price_level = get_competitor_price_levels(time - 1, fluctuations[time - 1])
+            next_state_id = get_state_id(next_seats_left, time - 1, next_booking_rate, next_competitor_price_level,
+                                         customer_segment)
+            max_future_q = Q2[next_state_id].max(axis=1)
+            max_future_q[(time - 1 == 0) | (next_seats_left == 0)] = 0.0
+
+            td = reward + gamma * max_future_q - Q2[state_id, a_idx]
+            update = active & (td != 0)
+            pairs, pair_idx = np.unique(state_id[update] * n_actions + a_idx[update], return_inverse=True)
+            counts = np.bincount(pair_idx)
+            mean_step = np.bincount(pair_idx, weights=(alpha * td)[update]) / counts
+            Q2[pairs // n_actions, pairs % n_actions] += mean_step.astype(np.float32)
+
+            seats_left = next_seats_left
+            booking_rate, competitor_price_level = next_booking_rate, next_competitor_price_level
+
+        rewards_log[start:start + size] = total_reward
+    return rewards_log
+
+# Per-episode schedules: linear learning-rate decay and exponential exploration decay with a floor
+alphas = np.linspace(alpha, alpha_min, episodes, dtype=np.float32)
+epsilons = np.maximum(epsilon_min, epsilon * epsilon_decay ** np.arange(episodes))
+
+# Training the Q-learning model
+if batch_size > 0:
+    rewards_log = train_batched(Q2, batch_size, alphas, gamma, epsilons)
+else:
+    n_threads = get_num_threads()
+    print(f"Training on {n_threads} threads")
+    rewards_log = train(Q2, alphas, gamma, epsilons, n_threads)
+for episode in range(99, episodes, 100):
+    print(f"Episode {episode + 1}/{episodes}, Total Reward: {rewards_log[episode]:.0f}")
+
+# Extract the optimal pricing policy based on trained Q-values with a single reduction over the action axis,
+# indexed like Q without the action axis
+optimal_action_idx = Q.argmax(axis=-1)
+optimal_policy = price_levels_arr[optimal_action_idx]
+
+def get_optimal_price(seats_left, time, booking_rate, competitor_price, customer_segment):
+    """
+    Looks up the optimal price for a state given by its seat count, time and category names.
+    - Example: `get_optimal_price(50, 5, 'Medium', 'Low', 'Economy')`.
+    """
+    return optimal_policy[seats_left // SEAT_BIN, time, BR[booking_rate], CP[competitor_price], SEG[customer_segment]]
 
 # print("\nOptimal pricing policy when time is 5 and customer segment is 'Economy':")
 # for seats_left in range(num_seats + 1):
 #     for booking_rate in booking_rates:
 #         for competitor_price in competitor_prices:
-#             state = (seats_left, 5, booking_rate, competitor_price, 'Economy')
-#             action = optimal_policy.get(state, None)
+#             action = get_optimal_price(seats_left, 5, booking_rate, competitor_price, 'Economy')
 #             if action:
 #                 print(f"Seats left: {seats_left}, Booking rate: {booking_rate}, "
 #                       f"Competitor price: {competitor_price}, Optimal price: {action}")